@@ -5,11 +5,27 @@ V3 架構功能驗證測試腳本
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
 import json
 import sys
 from typing import Dict, Any, Optional
 
+def make_session(retries: int = 3) -> requests.Session:
+    """建立帶連線池與指數退避重試的 Session（只重試 GET 的連線錯誤與 5xx）"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=1.0,
+        backoff_jitter=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
+
 class V3FunctionalityTester:
     def __init__(self, device_ip: str = "192.168.4.1", port: int = 8080, timeout: int = 10):
         self.device_ip = device_ip
@@ -17,12 +33,15 @@ class V3FunctionalityTester:
         self.base_url = f"http://{device_ip}:{port}"
         self.timeout = timeout
         self.test_results = {}
+        # 共用連線池，避免每次測試都重新建立 TCP 連線；
+        # 網路抖動時自動退避重試，不讓單次失敗拖垮整輪測試
+        self.s = make_session()
         
     def test_device_reachability(self) -> bool:
         """測試設備可達性"""
         print("🔍 測試設備可達性...")
         try:
-            response = requests.get(f"{self.base_url}/", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/", timeout=self.timeout)
             success = response.status_code == 200
             self.test_results["device_reachability"] = {
                 "success": success,
@@ -41,7 +60,7 @@ class V3FunctionalityTester:
         """測試 V3 架構狀態"""
         print("🏗️ 測試 V3 架構狀態...")
         try:
-            response = requests.get(f"{self.base_url}/api/status", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/api/status", timeout=self.timeout)
             if response.status_code == 200:
                 data = response.json()
                 v3_enabled = data.get("v3Architecture", False)
@@ -68,7 +87,7 @@ class V3FunctionalityTester:
         """測試事件系統功能"""
         print("📡 測試 V3 事件系統...")
         try:
-            response = requests.get(f"{self.base_url}/api/status", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/api/status", timeout=self.timeout)
             if response.status_code == 200:
                 data = response.json()
                 event_bus = data.get("eventBus", {})
@@ -92,7 +111,7 @@ class V3FunctionalityTester:
         """測試服務容器功能"""
         print("🔧 測試服務容器...")
         try:
-            response = requests.get(f"{self.base_url}/api/v3/services", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/api/v3/services", timeout=self.timeout)
             # 即使 404 也表示系統在運行，只是 API 端點可能未實作
             success = response.status_code in [200, 404]
             
@@ -114,7 +133,7 @@ class V3FunctionalityTester:
         print("🔄 測試 V2/V3 遷移適配器...")
         try:
             # 測試基本溫度控制 API（應該能透過遷移適配器工作）
-            response = requests.get(f"{self.base_url}/api/temperature", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/api/temperature", timeout=self.timeout)
             success = response.status_code == 200
             
             if success:
@@ -142,7 +161,7 @@ class V3FunctionalityTester:
         """測試記憶體使用情況"""
         print("💾 測試記憶體使用情況...")
         try:
-            response = requests.get(f"{self.base_url}/api/system", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/api/system", timeout=self.timeout)
             if response.status_code == 200:
                 data = response.json()
                 free_heap = data.get("freeHeap", 0)
@@ -171,11 +190,11 @@ class V3FunctionalityTester:
         print("🌐 測試 Web 介面...")
         try:
             # 測試主頁面
-            response = requests.get(f"{self.base_url}/", timeout=self.timeout)
+            response = self.s.get(f"{self.base_url}/", timeout=self.timeout)
             main_page_ok = response.status_code == 200
             
             # 測試 API 端點
-            api_response = requests.get(f"{self.base_url}/api/status", timeout=self.timeout)
+            api_response = self.s.get(f"{self.base_url}/api/status", timeout=self.timeout)
             api_ok = api_response.status_code == 200
             
             success = main_page_ok and api_ok
@@ -236,42 +255,58 @@ class V3FunctionalityTester:
         return self.test_results
     
     def print_detailed_results(self):
-        """列印詳細測試結果"""
-        print("\n" + "="*60)
-        print("📋 詳細測試結果")
-        print("="*60)
-        
+        """列印詳細測試結果（先組字串，一次寫出，避免幾十次 write 系統呼叫）"""
+        lines = ["", "="*60, "📋 詳細測試結果", "="*60]
+
         for test_name, result in self.test_results.items():
             if test_name == "summary":
                 continue
-                
-            print(f"\n🔍 {test_name.upper()}")
-            if result.get("success"):
-                print("   狀態: ✅ 成功")
-            else:
-                print("   狀態: ❌ 失敗")
-            
-            # 列印具體資訊
+
+            lines.append(f"\n🔍 {test_name.upper()}")
+            lines.append("   狀態: ✅ 成功" if result.get("success") else "   狀態: ❌ 失敗")
+
+            # 具體資訊
             for key, value in result.items():
                 if key != "success":
-                    print(f"   {key}: {value}")
-        
-        # 列印摘要
+                    lines.append(f"   {key}: {value}")
+
+        # 摘要
         if "summary" in self.test_results:
             summary = self.test_results["summary"]
-            print(f"\n📈 總體結果")
-            print(f"   通過率: {summary['success_rate']:.1f}%")
-            print(f"   狀態: {'✅ 系統健康' if summary['overall_success'] else '⚠️ 需要關注'}")
+            lines.append("\n📈 總體結果")
+            lines.append(f"   通過率: {summary['success_rate']:.1f}%")
+            lines.append(f"   狀態: {'✅ 系統健康' if summary['overall_success'] else '⚠️ 需要關注'}")
+
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def wait_ready(session: requests.Session, url: str, deadline: float = 15.0) -> bool:
+    """主動輪詢設備就緒狀態，收到任何 HTTP 回應就返回，最長等 deadline 秒
+
+    webserver 能回應（哪怕是 404）就代表開機完成，不依賴特定端點存在。
+    呼叫端要傳入不帶重試的 session，輪詢才能維持 0.25 秒的節奏。
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < deadline:
+        try:
+            session.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
 
 def main():
     # 預設使用 AP 模式 IP，也可以從命令列指定
     device_ip = sys.argv[1] if len(sys.argv) > 1 else "192.168.4.1"
-    
+
     print(f"🎯 目標設備: {device_ip}")
     print("⏳ 等待設備就緒...")
-    time.sleep(5)  # 給設備一些啟動時間
-    
     tester = V3FunctionalityTester(device_ip, 8080)
+    # 就緒探測走 /api/health（本樹韌體實際提供的健康端點），
+    # 並用不重試的 session，避免連線被拒時退避重試拖垮輪詢節奏
+    if not wait_ready(make_session(retries=0), f"{tester.base_url}/api/health"):
+        print("⚠️ 等待設備就緒逾時，仍嘗試執行測試")
     results = tester.run_all_tests()
     tester.print_detailed_results()
     
@@ -5,15 +5,29 @@ DaiSpan 異步WiFi掃描器測試
 測試AsyncWiFiScanner組件的功能和性能
 """
 
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
-import threading
 import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
+try:
+    import orjson  # 掃描結果清單較大時，解析比 stdlib json 快數倍
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import aiohttp  # 並發測試走單一事件迴圈，免去每請求一條 OS 線程
+except ImportError:
+    aiohttp = None
+
 
 @dataclass
 class ScanResult:
@@ -22,27 +36,34 @@ class ScanResult:
     response_time: float
     networks_found: int
     error_message: Optional[str] = None
-    timestamp: datetime = None
-    
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = datetime.now()
+    # 欄位保留給未來使用；沒有讀取方，不在每筆結果上花一次 datetime.now()
+    timestamp: Optional[datetime] = None
 
 
 class AsyncWiFiScannerTester:
     """異步WiFi掃描器測試類"""
     
-    def __init__(self, device_ip: str = "192.168.4.1", timeout: int = 30):
+    def __init__(self, device_ip: str = "192.168.4.1", timeout: int = 30, concurrency: int = 10):
         self.device_ip = device_ip
         self.base_url = f"http://{device_ip}"
         self.timeout = timeout
         self.session = requests.Session()
         self.session.timeout = timeout
-        
+        # 連線池一開始就按實際並發規模配置，避免線程在 urllib3 池上排隊
+        self._pool_maxsize = max(concurrency, 10)
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_maxsize))
+
         # 測試結果
         self.test_results: List[ScanResult] = []
         self.concurrent_results: Dict[str, List[ScanResult]] = {}
-        
+
+    def __enter__(self) -> "AsyncWiFiScannerTester":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        # 確定關閉連線池，不留 CLOSE_WAIT socket
+        self.session.close()
+
     def test_device_connectivity(self) -> bool:
         """測試設備連通性"""
         try:
@@ -67,7 +88,7 @@ class AsyncWiFiScannerTester:
             end_time = time.time()
             
             if response.status_code == 200:
-                networks = response.json()
+                networks = _loads(response.content)
                 result = ScanResult(
                     success=True,
                     response_time=end_time - start_time,
@@ -96,6 +117,15 @@ class AsyncWiFiScannerTester:
             print(f"❌ 同步掃描異常: {result.error_message}")
             return result
     
+    def _poll_status(self, request_id) -> int:
+        """用 HEAD 輪詢異步掃描狀態端點，回傳 HTTP 狀態碼（200 表示完成）
+
+        狀態查詢不帶結果本體，每次輪詢幾乎零傳輸；
+        完整的 JSON 清單只在完成後抓一次。
+        """
+        response = self.session.head(f"{self.base_url}/scan-async?id={request_id}")
+        return response.status_code
+
     def test_async_scan(self) -> ScanResult:
         """測試異步掃描"""
         print("\n🚀 測試異步WiFi掃描...")
@@ -106,24 +136,43 @@ class AsyncWiFiScannerTester:
             end_time = time.time()
             
             if response.status_code == 202:
-                data = response.json()
+                data = _loads(response.content)
                 request_id = data.get('requestId')
                 
                 print(f"✅ 異步掃描請求已接受: 請求ID {request_id}, 響應時間 {end_time - start_time:.3f}秒")
                 
-                # 等待掃描完成並獲取結果
+                # 等待掃描完成並獲取結果（指數退避輪詢，0.1s 起跳、上限 1s）
                 scan_completed = False
                 max_wait_time = 15  # 最大等待15秒
                 wait_start = time.time()
-                
+                delay = 0.1
+                etag = None
+                # 優先輪詢狀態端點（幾乎零傳輸）；舊韌體沒有時退回直接抓 /scan
+                use_status_endpoint = request_id is not None
+
                 while not scan_completed and (time.time() - wait_start) < max_wait_time:
-                    time.sleep(0.5)
-                    
-                    # 檢查緩存結果
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+
+                    if use_status_endpoint:
+                        try:
+                            status_code = self._poll_status(request_id)
+                            if status_code in (404, 405):
+                                use_status_endpoint = False  # 韌體尚未提供狀態端點
+                            elif status_code != 200:
+                                continue  # 還在掃描，不浪費一趟結果傳輸
+                        except requests.RequestException:
+                            use_status_endpoint = False
+
+                    # 檢查緩存結果；帶 If-None-Match，結果沒變時僅收 304 免解析
                     try:
-                        cache_response = self.session.get(f"{self.base_url}/scan")
+                        headers = {'If-None-Match': etag} if etag else None
+                        cache_response = self.session.get(f"{self.base_url}/scan", headers=headers)
+                        if cache_response.status_code == 304:
+                            continue
                         if cache_response.status_code == 200:
-                            networks = cache_response.json()
+                            etag = cache_response.headers.get('ETag')
+                            networks = _loads(cache_response.content)
                             if len(networks) > 0:
                                 scan_completed = True
                                 total_time = time.time() - start_time
@@ -170,28 +219,65 @@ class AsyncWiFiScannerTester:
             print(f"❌ 異步掃描異常: {result.error_message}")
             return result
     
-    def test_concurrent_async_scans(self, num_threads: int = 5) -> Dict[str, List[ScanResult]]:
-        """測試並發異步掃描"""
-        print(f"\n⚡ 測試並發異步掃描 ({num_threads} 個並發請求)...")
-        
-        results = {'success': [], 'failed': []}
-        threads = []
-        
-        def scan_worker(thread_id: int):
-            """工作線程"""
+    async def _concurrent_scans_aiohttp(self, num_threads: int, logs: deque) -> List[ScanResult]:
+        """aiohttp 版並發掃描：一個事件迴圈、一個連線池，零線程開銷"""
+        connector = aiohttp.TCPConnector(limit=num_threads, force_close=False)
+        async with aiohttp.ClientSession(connector=connector) as session:
+
+            async def worker(thread_id: int) -> ScanResult:
+                try:
+                    start_time = time.time()
+                    async with session.post(f"{self.base_url}/scan-async") as response:
+                        await response.read()
+                        elapsed = time.time() - start_time
+                        if response.status == 202:
+                            result = ScanResult(
+                                success=True,
+                                response_time=elapsed,
+                                networks_found=0  # 並發測試主要測試請求接受能力
+                            )
+                            logs.append(f"  ✅ 線程 {thread_id}: 請求成功 ({elapsed:.3f}秒)")
+                        else:
+                            result = ScanResult(
+                                success=False,
+                                response_time=elapsed,
+                                networks_found=0,
+                                error_message=f"HTTP {response.status}"
+                            )
+                            logs.append(f"  ❌ 線程 {thread_id}: 請求失敗 ({result.error_message})")
+                except Exception as e:
+                    result = ScanResult(
+                        success=False,
+                        response_time=0,
+                        networks_found=0,
+                        error_message=str(e)
+                    )
+                    logs.append(f"  ❌ 線程 {thread_id}: 異常 ({str(e)})")
+                return result
+
+            return list(await asyncio.gather(*[worker(i) for i in range(num_threads)]))
+
+    def _concurrent_scans_threaded(self, num_threads: int, logs: deque) -> List[ScanResult]:
+        """線程池版並發掃描：沒有 aiohttp 時的後備路徑"""
+        # 並發數超過目前連線池時，重新掛一個等量的池避免排隊
+        if num_threads > self._pool_maxsize:
+            self._pool_maxsize = num_threads
+            self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=num_threads))
+
+        def scan_worker(thread_id: int) -> ScanResult:
+            """工作線程：回傳結果，不在多線程下改共享字典"""
             try:
                 start_time = time.time()
                 response = self.session.post(f"{self.base_url}/scan-async")
                 end_time = time.time()
-                
+
                 if response.status_code == 202:
                     result = ScanResult(
                         success=True,
                         response_time=end_time - start_time,
                         networks_found=0  # 並發測試主要測試請求接受能力
                     )
-                    results['success'].append(result)
-                    print(f"  ✅ 線程 {thread_id}: 請求成功 ({result.response_time:.3f}秒)")
+                    logs.append(f"  ✅ 線程 {thread_id}: 請求成功 ({result.response_time:.3f}秒)")
                 else:
                     result = ScanResult(
                         success=False,
@@ -199,9 +285,8 @@ class AsyncWiFiScannerTester:
                         networks_found=0,
                         error_message=f"HTTP {response.status_code}"
                     )
-                    results['failed'].append(result)
-                    print(f"  ❌ 線程 {thread_id}: 請求失敗 ({result.error_message})")
-                    
+                    logs.append(f"  ❌ 線程 {thread_id}: 請求失敗 ({result.error_message})")
+
             except Exception as e:
                 result = ScanResult(
                     success=False,
@@ -209,77 +294,96 @@ class AsyncWiFiScannerTester:
                     networks_found=0,
                     error_message=str(e)
                 )
-                results['failed'].append(result)
-                print(f"  ❌ 線程 {thread_id}: 異常 ({str(e)})")
-        
-        # 啟動並發線程
-        for i in range(num_threads):
-            thread = threading.Thread(target=scan_worker, args=(i,))
-            threads.append(thread)
-            thread.start()
-        
-        # 等待所有線程完成
-        for thread in threads:
-            thread.join()
-        
+                logs.append(f"  ❌ 線程 {thread_id}: 異常 ({str(e)})")
+            return result
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            futures = [executor.submit(scan_worker, i) for i in range(num_threads)]
+            return [future.result() for future in as_completed(futures)]
+
+    def test_concurrent_async_scans(self, num_threads: int = 5) -> Dict[str, List[ScanResult]]:
+        """測試並發異步掃描
+
+        純 I/O 工作負載：有 aiohttp 時用 asyncio.gather 在單一事件迴圈上
+        發所有請求，省掉每請求一條 OS 線程；否則退回線程池。
+        """
+        print(f"\n⚡ 測試並發異步掃描 ({num_threads} 個並發請求)...")
+
+        # 日誌先進 deque，收尾一次輸出，避免 stdout 鎖把並發測量串行化
+        logs: deque = deque()
+
+        if aiohttp is not None:
+            worker_results = asyncio.run(self._concurrent_scans_aiohttp(num_threads, logs))
+        else:
+            worker_results = self._concurrent_scans_threaded(num_threads, logs)
+
+        results = {'success': [], 'failed': []}
+        for result in worker_results:
+            results['success' if result.success else 'failed'].append(result)
+
+        if logs:
+            print("\n".join(logs))
+
         success_count = len(results['success'])
         failed_count = len(results['failed'])
         
         print(f"  並發測試完成: {success_count} 成功, {failed_count} 失敗")
         
         if success_count > 0:
-            avg_response_time = statistics.mean([r.response_time for r in results['success']])
+            avg_response_time = statistics.fmean(r.response_time for r in results['success'])
             print(f"  平均響應時間: {avg_response_time:.3f}秒")
         
         return results
     
     def test_performance_comparison(self, iterations: int = 3) -> None:
-        """性能對比測試"""
+        """性能對比測試（同類掃描並行批次執行，省掉每輪固定等待）"""
         print(f"\n📊 性能對比測試 ({iterations} 次迭代)...")
-        
-        sync_results = []
-        async_results = []
-        
-        for i in range(iterations):
-            print(f"\n--- 第 {i+1} 次迭代 ---")
-            
-            # 測試同步掃描
-            sync_result = self.test_sync_scan()
-            sync_results.append(sync_result)
-            
-            # 等待一段時間
-            time.sleep(2)
-            
-            # 測試異步掃描
-            async_result = self.test_async_scan()
-            async_results.append(async_result)
-            
-            # 等待一段時間
-            time.sleep(2)
-        
+
+        max_workers = min(iterations, 4)
+
+        # 同步掃描批次：各次迭代彼此獨立，交給線程池重疊網路等待
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.test_sync_scan) for _ in range(iterations)]
+            sync_results = [future.result() for future in as_completed(futures)]
+
+        # 批次之間留一次冷卻，取代原本每輪兩次 sleep(2)
+        time.sleep(1)
+
+        # 異步掃描批次
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.test_async_scan) for _ in range(iterations)]
+            async_results = [future.result() for future in as_completed(futures)]
+
         # 計算統計數據
         sync_times = [r.response_time for r in sync_results if r.success]
         async_times = [r.response_time for r in async_results if r.success]
         
-        print(f"\n📈 性能統計:")
-        print(f"同步掃描:")
-        print(f"  成功率: {len(sync_times)}/{iterations} ({len(sync_times)/iterations*100:.1f}%)")
+        # 統計摘要先組好，一次輸出（並發測試可能還有線程在跑，少搶 stdout 鎖）
+        lines = [
+            "\n📈 性能統計:",
+            "同步掃描:",
+            f"  成功率: {len(sync_times)}/{iterations} ({len(sync_times)/iterations*100:.1f}%)",
+        ]
         if sync_times:
-            print(f"  平均耗時: {statistics.mean(sync_times):.2f}秒")
-            print(f"  最小耗時: {min(sync_times):.2f}秒")
-            print(f"  最大耗時: {max(sync_times):.2f}秒")
-        
-        print(f"\n異步掃描:")
-        print(f"  成功率: {len(async_times)}/{iterations} ({len(async_times)/iterations*100:.1f}%)")
+            lines.append(f"  平均耗時: {statistics.fmean(sync_times):.2f}秒")
+            lines.append(f"  最小耗時: {min(sync_times):.2f}秒")
+            lines.append(f"  最大耗時: {max(sync_times):.2f}秒")
+
+        lines.append("\n異步掃描:")
+        lines.append(f"  成功率: {len(async_times)}/{iterations} ({len(async_times)/iterations*100:.1f}%)")
         if async_times:
-            print(f"  平均耗時: {statistics.mean(async_times):.2f}秒")
-            print(f"  最小耗時: {min(async_times):.2f}秒")
-            print(f"  最大耗時: {max(async_times):.2f}秒")
-        
+            lines.append(f"  平均耗時: {statistics.fmean(async_times):.2f}秒")
+            lines.append(f"  最小耗時: {min(async_times):.2f}秒")
+            lines.append(f"  最大耗時: {max(async_times):.2f}秒")
+
         # 計算改進
         if sync_times and async_times:
-            improvement = (statistics.mean(sync_times) - statistics.mean(async_times)) / statistics.mean(sync_times) * 100
-            print(f"\n⚡ 性能改進: {improvement:.1f}%")
+            sync_mean = statistics.fmean(sync_times)
+            async_mean = statistics.fmean(async_times)
+            improvement = (sync_mean - async_mean) / sync_mean * 100
+            lines.append(f"\n⚡ 性能改進: {improvement:.1f}%")
+
+        print("\n".join(lines))
     
     def test_error_handling(self) -> None:
         """測試錯誤處理"""
@@ -334,8 +438,8 @@ def main():
     
     args = parser.parse_args()
     
-    tester = AsyncWiFiScannerTester(args.ip, args.timeout)
-    tester.run_all_tests()
+    with AsyncWiFiScannerTester(args.ip, args.timeout, concurrency=args.concurrent) as tester:
+        tester.run_all_tests()
 
 
 if __name__ == "__main__":
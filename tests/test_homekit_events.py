@@ -4,17 +4,41 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
 import re
 
+def make_session(retries: int = 3) -> requests.Session:
+    """建立帶連線池與指數退避重試的 Session（只重試 GET 的連線錯誤與 5xx）"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=1.0,
+        backoff_jitter=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
+
+# 預先編譯的事件統計樣式，避免每次呼叫重新查表/編譯
+STATS_RE = re.compile(r'事件統計.*?佇列:(\d+)\s*訂閱:(\d+)\s*已處理:(\d+)', re.DOTALL)
+
+# 共用連線池，所有請求打同一台設備，重複使用 TCP 連線
+_SESSION = make_session()
+# simulation-toggle 會改變設備狀態（GET 不冪等），不可自動重試
+_TOGGLE_SESSION = make_session(retries=0)
+
 def get_event_stats(device_ip="192.168.50.192"):
     """獲取當前事件統計"""
     try:
-        response = requests.get(f"http://{device_ip}:8080/", timeout=5)
+        response = _SESSION.get(f"http://{device_ip}:8080/", timeout=5)
         content = response.text
         
         # 提取事件統計
-        stats_match = re.search(r'事件統計.*?佇列:(\d+)\s*訂閱:(\d+)\s*已處理:(\d+)', content, re.DOTALL)
+        stats_match = STATS_RE.search(content)
         if stats_match:
             queue_size = int(stats_match.group(1))
             subscriptions = int(stats_match.group(2))
@@ -37,7 +61,7 @@ def test_simulation_mode_toggle(device_ip="192.168.50.192"):
     
     # 觸發模擬模式切換
     try:
-        response = requests.get(f"http://{device_ip}:8080/simulation-toggle", timeout=5)
+        response = _TOGGLE_SESSION.get(f"http://{device_ip}:8080/simulation-toggle", timeout=5)
         print(f"模擬模式切換請求: HTTP {response.status_code}")
         
         # 等待事件處理
@@ -4,77 +4,128 @@ V3 HomeKit 整合測試腳本
 測試 HomeKit 指令是否能正確觸發 V3 事件系統
 """
 
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
 from typing import Dict, Any
 
+# 預先編譯的 /simulation 頁面解析樣式，場景測試每輪都會用到
+_TGT_TEMP_RE = re.compile(r'目標溫度：</strong>([0-9.]+)°C')
+_CUR_TEMP_RE = re.compile(r'當前溫度：</strong>([0-9.]+)°C')
+
+# 欄位前綴與長度在模組層算好，解析時不再重算
+_POWER_PREFIX = "電源：</strong>"
+_POWER_PREFIX_LEN = len(_POWER_PREFIX)
+_MODE_PREFIX = "模式：</strong>"
+_MODE_PREFIX_LEN = len(_MODE_PREFIX)
+
+# 運行狀態標記，依頁面出現順序排列
+_OPERATION_MARKERS = (
+    ("❄️ 制冷中", "cooling"),
+    ("🔥 制熱中", "heating"),
+    ("⏸️ 待機", "idle"),
+)
+
 class HomeKitV3Tester:
     def __init__(self, device_ip: str = "192.168.50.192", port: int = 8080):
         self.device_ip = device_ip
         self.port = port
         self.base_url = f"http://{device_ip}:{port}"
-        
+        # 共用 keep-alive 連線：場景迴圈的每個 POST/GET 重複使用同一條 socket
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+        # 場景只有少數固定參數組合，POST 請求準備一次就能重複送
+        self._prep_cache: Dict[frozenset, requests.PreparedRequest] = {}
+
     def get_simulation_status(self) -> Dict[str, Any]:
         """獲取模擬器當前狀態"""
         try:
-            response = requests.get(f"{self.base_url}/simulation", timeout=5)
+            response = self.session.get(f"{self.base_url}/simulation", timeout=5)
             content = response.text
             
-            # 解析狀態資訊
+            # 解析狀態資訊：單趟掃描，游標隨頁面欄位順序推進
             status = {}
-            
-            if "電源：</strong>開啟" in content:
-                status["power"] = True
-            elif "電源：</strong>關閉" in content:
-                status["power"] = False
-                
-            # 解析模式
-            if "模式：</strong>0" in content:
-                status["mode"] = 0
-            elif "模式：</strong>1" in content:
-                status["mode"] = 1
-            elif "模式：</strong>2" in content:
-                status["mode"] = 2
-            elif "模式：</strong>3" in content:
-                status["mode"] = 3
-                
-            # 解析溫度
-            import re
-            temp_match = re.search(r'目標溫度：</strong>([0-9.]+)°C', content)
+            pos = 0
+
+            # 電源
+            idx = content.find(_POWER_PREFIX, pos)
+            if idx != -1:
+                idx += _POWER_PREFIX_LEN
+                if content.startswith("開啟", idx):
+                    status["power"] = True
+                elif content.startswith("關閉", idx):
+                    status["power"] = False
+                pos = idx
+
+            # 解析模式（頁面固定輸出 0-3 單一數字）
+            idx = content.find(_MODE_PREFIX, pos)
+            if idx != -1:
+                idx += _MODE_PREFIX_LEN
+                mode_char = content[idx:idx + 1]
+                if mode_char in "0123":
+                    status["mode"] = int(mode_char)
+                pos = idx
+
+            # 解析溫度，從游標之後搜尋以跳過已掃描的前綴
+            temp_match = _TGT_TEMP_RE.search(content, pos)
             if temp_match:
                 status["target_temp"] = float(temp_match.group(1))
-                
-            current_temp_match = re.search(r'當前溫度：</strong>([0-9.]+)°C', content)
+                pos = temp_match.end()
+
+            current_temp_match = _CUR_TEMP_RE.search(content, pos)
             if current_temp_match:
                 status["current_temp"] = float(current_temp_match.group(1))
-                
-            # 解析運行狀態
-            if "❄️ 制冷中" in content:
-                status["operation"] = "cooling"
-            elif "🔥 制熱中" in content:
-                status["operation"] = "heating"
-            elif "⏸️ 待機" in content:
-                status["operation"] = "idle"
-                
+                pos = current_temp_match.end()
+
+            # 解析運行狀態：只掃游標之後剩下的尾段
+            operation = next(
+                (op for marker, op in _OPERATION_MARKERS if content.find(marker, pos) != -1),
+                None,
+            )
+            if operation is not None:
+                status["operation"] = operation
+
             return status
         except Exception as e:
             print(f"❌ 無法獲取狀態: {e}")
             return {}
     
     def send_simulation_command(self, **params) -> bool:
-        """發送模擬控制命令"""
+        """發送模擬控制命令（同一組參數只做一次 URL 編碼與標頭合併）"""
         try:
-            response = requests.post(
-                f"{self.base_url}/simulation-control",
-                data=params,
-                timeout=5
-            )
+            key = frozenset(params.items())
+            prep = self._prep_cache.get(key)
+            if prep is None:
+                prep = self.session.prepare_request(
+                    requests.Request('POST', f"{self.base_url}/simulation-control", data=params)
+                )
+                self._prep_cache[key] = prep
+            response = self.session.send(prep, timeout=5)
             return response.status_code == 200
         except Exception as e:
             print(f"❌ 命令發送失敗: {e}")
             return False
     
+    def _wait_for(self, expected: Dict[str, Any], timeout: float = 2.0) -> Dict[str, Any]:
+        """輪詢模擬器狀態直到符合預期或逾時，取代固定 sleep
+
+        退避間隔 50ms 起跳、上限 400ms：設備通常幾十毫秒內就定案，
+        慢的時候才會等滿 timeout。回傳最後讀到的狀態。
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            status = self.get_simulation_status()
+            if all(status.get(key) == value for key, value in expected.items()):
+                return status
+            if time.monotonic() >= deadline:
+                return status
+            time.sleep(delay)
+            delay = min(delay * 2, 0.4)
+
     def test_homekit_scenarios(self):
         """測試 HomeKit 常見使用場景"""
         print("🏠 開始 HomeKit 使用場景測試...\n")
@@ -108,13 +159,16 @@ class HomeKitV3Tester:
         
         passed_tests = 0
         total_tests = len(scenarios)
-        
+
+        # 初始狀態只抓一次；之後每個場景的起點就是上一個場景驗證過的終點，
+        # 連續場景間省掉一趟 GET（keep-alive 連線上剩下的請求背靠背送出）
+        previous_status = self.get_simulation_status()
+
         for i, scenario in enumerate(scenarios, 1):
             print(f"🧪 測試 {i}/{total_tests}: {scenario['name']}")
             print(f"   描述: {scenario['description']}")
-            
-            # 獲取初始狀態
-            initial_status = self.get_simulation_status()
+
+            initial_status = previous_status
             print(f"   初始狀態: {initial_status}")
             
             # 發送命令
@@ -123,11 +177,8 @@ class HomeKitV3Tester:
                 print(f"   ❌ 命令發送失敗")
                 continue
                 
-            # 等待處理
-            time.sleep(2)
-            
-            # 檢查結果
-            final_status = self.get_simulation_status()
+            # 輪詢直到狀態符合預期（設備快就快，慢時最多等 2 秒）
+            final_status = self._wait_for(scenario["expected"])
             print(f"   最終狀態: {final_status}")
             
             # 驗證預期結果
@@ -145,10 +196,10 @@ class HomeKitV3Tester:
                 passed_tests += 1
             else:
                 print(f"   ❌ 測試失敗")
-                
+
+            previous_status = final_status
             print()
-            time.sleep(1)
-            
+
         # 總結
         print("=" * 60)
         print(f"📊 HomeKit 場景測試總結")
@@ -171,11 +222,15 @@ def main():
     print("=" * 60)
     
     tester = HomeKitV3Tester()
-    
-    # 檢查設備連接
+
+    # 檢查設備連接（走 tester 的 session，順便暖好 keep-alive 連線）
+    # 先試 HEAD 省掉整頁主體；韌體不支援時退回不讀主體的 stream GET
     print("🔍 檢查設備連接...")
     try:
-        response = requests.get(f"http://192.168.50.192:8080/", timeout=5)
+        response = tester.session.head(f"{tester.base_url}/", timeout=5)
+        if response.status_code in (405, 501):
+            response = tester.session.get(f"{tester.base_url}/", stream=True, timeout=5)
+            response.close()
         if response.status_code == 200:
             print("✅ 設備連接正常")
         else:
@@ -4,46 +4,154 @@ V3 真實空調測試腳本
 測試 V3 架構在真實 Daikin 空調環境下的功能
 """
 
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, NamedTuple, Optional
+
+try:
+    import orjson  # SIMD 加速的 JSON 解析，沒裝就退回標準庫
+except ImportError:
+    orjson = None
+
+def _loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# 預先編譯的主頁解析樣式，綜合測試一輪會呼叫 get_system_status 七次以上。
+# 所有欄位合併成單一交替式：整頁只掃一趟，而不是三個子串檢查加兩次 search
+_COMBINED_RE = re.compile(
+    r'(V3 事件驅動)|(✅ 活躍)|(切換模擬模式)'
+    r'|可用記憶體.*?(\d+)\s*bytes'
+    r'|運行時間.*?(\d+)天\s*(\d+)時\s*(\d+)分'
+)
+
+class SystemStatus(NamedTuple):
+    """get_system_status 的回傳值：固定欄位、C 層 tuple 索引存取，
+    消費端不再對每個欄位做 dict 雜湊查找。未要求的欄位維持預設值。"""
+    connection: bool = False
+    v3_architecture: bool = False
+    migration_active: bool = False
+    is_real_mode: bool = False
+    free_memory: int = 0
+    uptime_minutes: int = 0
+    content_size: int = 0
+    error: Optional[str] = None
+
+# get_system_status 可解析的欄位全集（connection 與 content_size 一律回報）
+_ALL_STATUS_FIELDS = frozenset({
+    "v3_architecture", "migration_active", "is_real_mode",
+    "free_memory", "uptime_minutes",
+})
+
+# 控制準備度的兩個標記：合併成單一交替式一趟掃完，不做兩次獨立子串搜尋
+_READY_MARKS_RE = re.compile(r'(V3 事件驅動)|(✅ 活躍)')
+
+# 串流掃描時每輪往回補掃的字元數：比最長的單行樣式
+# （可用記憶體/運行時間行）都長，樣式被 chunk 邊界切斷也不會漏
+_SCAN_OVERLAP = 80
+
+def _apply_match(match: "re.Match", status: Dict[str, Any], remaining: set) -> None:
+    """依命中的群組寫入對應欄位；重掃重疊區時已取得的欄位自動略過"""
+    if match.group(1) and "v3_architecture" in remaining:
+        status["v3_architecture"] = True
+        remaining.discard("v3_architecture")
+    elif match.group(2) and "migration_active" in remaining:
+        status["migration_active"] = True
+        remaining.discard("migration_active")
+    elif match.group(3) and "is_real_mode" in remaining:
+        status["is_real_mode"] = True
+        remaining.discard("is_real_mode")
+    elif match.group(4) and "free_memory" in remaining:
+        status["free_memory"] = int(match.group(4))
+        remaining.discard("free_memory")
+    elif match.group(5) and "uptime_minutes" in remaining:
+        days, hours, minutes = map(int, match.group(5, 6, 7))
+        status["uptime_minutes"] = days * 1440 + hours * 60 + minutes
+        remaining.discard("uptime_minutes")
 
 class RealACTesterV3:
     def __init__(self, device_ip: str = "192.168.50.192", port: int = 8080):
         self.device_ip = device_ip
         self.port = port
         self.base_url = f"http://{device_ip}:{port}"
-        
-    def get_system_status(self) -> Dict[str, Any]:
-        """獲取系統狀態資訊"""
+        # 端點 URL 在這裡組好一次，熱路徑上不再每次呼叫都做 f-string 插值
+        self.url_root = f"{self.base_url}/"
+        self.url_api_status = f"{self.base_url}/api/status"
+        self.url_homekit = f"{self.base_url}/homekit"
+        # 共用連線池：整輪測試只打同一台設備，重複使用 keep-alive 連線
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        # 短 TTL 狀態快取：綜合測試相鄰步驟各自抓狀態，1 秒內直接重用
+        self._status_cache: Dict[frozenset, tuple] = {}
+
+    def get_system_status(self, fields: frozenset = _ALL_STATUS_FIELDS) -> SystemStatus:
+        """獲取系統狀態資訊
+
+        優先走 /api/status JSON（約百位元組，免整頁 HTML 傳輸與掃描）；
+        舊韌體沒有這個端點時退回主頁的單趟掃描。
+
+        fields 指定呼叫端實際需要的欄位子集：HTML 路徑只解析要求的
+        欄位，且全部到手就提前停止掃描。connection 與 content_size 一律回報。
+
+        結果以 1 秒 TTL 快取（依 fields 分開記），綜合測試相鄰步驟
+        不會為同一份資料重複打一趟 HTTP；取樣間隔 3 秒的穩定性迴圈不受影響。
+        """
+        cached = self._status_cache.get(fields)
+        if cached is not None and time.monotonic() - cached[0] < 1.0:
+            return cached[1]
+
         try:
-            response = requests.get(f"{self.base_url}/", timeout=10)
-            content = response.text
-            
-            status = {
-                "connection": response.status_code == 200,
-                "v3_architecture": "V3 事件驅動" in content,
-                "migration_active": "✅ 活躍" in content,
-                "is_real_mode": "切換模擬模式" in content,
-                "content_size": len(content)
-            }
-            
-            # 解析記憶體資訊
-            import re
-            memory_match = re.search(r'可用記憶體.*?(\d+)\s*bytes', content)
-            if memory_match:
-                status["free_memory"] = int(memory_match.group(1))
-            
-            # 解析運行時間
-            runtime_match = re.search(r'運行時間.*?(\d+)天\s*(\d+)時\s*(\d+)分', content)
-            if runtime_match:
-                days, hours, minutes = map(int, runtime_match.groups())
-                status["uptime_minutes"] = days * 1440 + hours * 60 + minutes
-                
+            api_response = self.session.get(self.url_api_status, timeout=(1.0, 5.0))
+            if api_response.status_code == 200:
+                try:
+                    data = _loads(api_response.content)
+                    status = SystemStatus(
+                        connection=True,
+                        v3_architecture=bool(data.get("v3Architecture")),
+                        migration_active=bool(data.get("migrationActive")),
+                        is_real_mode=bool(data.get("realMode")),
+                        content_size=len(api_response.content),
+                        free_memory=int(data.get("freeHeap", 0)),
+                        uptime_minutes=int(data.get("uptime", 0)) // 60,
+                    )
+                    self._status_cache[fields] = (time.monotonic(), status)
+                    return status
+                except (ValueError, TypeError):
+                    pass  # 回應不是預期的 JSON，走 HTML 後備路徑
+
+            # 串流下載主頁：邊收邊掃，欄位集齊就中止連線，尾段主體不必傳
+            with self.session.get(self.url_root, timeout=(1.0, 5.0), stream=True) as response:
+                response.encoding = response.encoding or "utf-8"
+
+                parsed: Dict[str, Any] = {}
+                remaining = set(fields)
+                text = ""
+                scan_pos = 0
+                for chunk in response.iter_content(4096, decode_unicode=True):
+                    text += chunk
+                    for match in _COMBINED_RE.finditer(text, scan_pos):
+                        _apply_match(match, parsed, remaining)
+                        if not remaining:
+                            break
+                    if not remaining:
+                        break
+                    # 下一輪從邊界往回補掃一小段，樣式跨 chunk 也抓得到
+                    scan_pos = max(0, len(text) - _SCAN_OVERLAP)
+
+                status = SystemStatus(
+                    connection=response.status_code == 200,
+                    # 提前中止時這是已接收的長度，完整讀完時等同整頁大小
+                    content_size=len(text),
+                    **parsed,
+                )
+
+            self._status_cache[fields] = (time.monotonic(), status)
             return status
         except Exception as e:
-            return {"error": str(e), "connection": False}
+            return SystemStatus(error=str(e))
     
     def test_s21_protocol_communication(self) -> Dict[str, Any]:
         """測試 S21 協議通訊"""
@@ -57,10 +165,12 @@ class RealACTesterV3:
         }
         
         try:
-            # 檢查系統是否在真實模式下正常運行
-            status = self.get_system_status()
-            
-            if status.get("is_real_mode"):
+            # 檢查系統是否在真實模式下正常運行（只解析會用到的三個欄位）
+            status = self.get_system_status(
+                frozenset({"is_real_mode", "free_memory", "uptime_minutes"})
+            )
+
+            if status.is_real_mode:
                 results["protocol_loaded"] = True
                 print("   ✅ 系統處於真實模式")
             else:
@@ -68,7 +178,7 @@ class RealACTesterV3:
                 return results
                 
             # 檢查記憶體使用情況（真實控制器比模擬控制器消耗更多記憶體）
-            free_memory = status.get("free_memory", 0)
+            free_memory = status.free_memory
             if 100000 <= free_memory <= 130000:  # 預期真實模式記憶體範圍
                 results["controller_initialized"] = True
                 print(f"   ✅ 控制器已初始化 (記憶體: {free_memory} bytes)")
@@ -76,7 +186,7 @@ class RealACTesterV3:
                 print(f"   ⚠️ 記憶體使用異常: {free_memory} bytes")
                 
             # 檢查系統穩定性（運行時間足夠長說明沒有崩潰）
-            uptime = status.get("uptime_minutes", 0)
+            uptime = status.uptime_minutes
             if uptime >= 5:  # 至少運行 5 分鐘
                 results["communication_ready"] = True
                 print(f"   ✅ 系統運行穩定 (運行時間: {uptime} 分鐘)")
@@ -103,17 +213,17 @@ class RealACTesterV3:
         
         try:
             # 檢查 HomeKit 設定頁面
-            response = requests.get(f"{self.base_url}/homekit", timeout=5)
+            response = self.session.get(self.url_homekit, timeout=(1.0, 5.0))
             if response.status_code == 200 and "HomeKit" in response.text:
                 results["homekit_accessible"] = True
                 print("   ✅ HomeKit 設定頁面可訪問")
             else:
                 print("   ❌ HomeKit 設定頁面不可訪問")
                 
-            # 檢查系統響應性
-            start_time = time.time()
-            status_response = requests.get(f"{self.base_url}/", timeout=5)
-            response_time = time.time() - start_time
+            # 檢查系統響應性（monotonic 不受 NTP 校時影響，不會誤判響應緩慢）
+            start_time = time.monotonic()
+            status_response = self.session.get(self.url_root, timeout=(1.0, 5.0))
+            response_time = time.monotonic() - start_time
             
             if status_response.status_code == 200 and response_time < 2.0:
                 results["system_responsive"] = True
@@ -121,8 +231,9 @@ class RealACTesterV3:
             else:
                 print(f"   ❌ 系統響應緩慢 ({response_time:.2f}s)")
                 
-            # 檢查 V3 架構狀態
-            if "V3 事件驅動" in status_response.text and "✅ 活躍" in status_response.text:
+            # 檢查 V3 架構狀態（單趟掃描，兩個標記都命中才算就緒）
+            found = {m.lastindex for m in _READY_MARKS_RE.finditer(status_response.text)}
+            if found >= {1, 2}:
                 results["ready_for_control"] = True
                 print("   ✅ V3 架構準備就緒，可接受 HomeKit 控制")
             else:
@@ -137,19 +248,30 @@ class RealACTesterV3:
         """測試真實模式下的記憶體穩定性"""
         print("💾 測試真實模式記憶體穩定性...")
         
+        # 併發取樣：每筆讀取各自延遲 i*3 秒後送出，維持 3 秒取樣間距，
+        # 但網路等待彼此重疊——總時長從 5×(請求+3s) 降到最後一筆延遲加一次請求
+        def sample(delay: float) -> int:
+            if delay:
+                time.sleep(delay)
+            return self.get_system_status(frozenset({"free_memory"})).free_memory
+
+        # 取樣結果先收集、結束後一次輸出：併發讀取不會搶 stdout，
+        # 也把五次 write 系統呼叫縮成一次
         memory_readings = []
-        
-        for i in range(5):
-            try:
-                status = self.get_system_status()
-                memory = status.get("free_memory", 0)
-                memory_readings.append(memory)
-                print(f"   讀取 {i+1}: {memory} bytes")
-                time.sleep(3)
-            except Exception as e:
-                print(f"   讀取 {i+1} 失敗: {e}")
-                memory_readings.append(0)
-        
+        lines = []
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(sample, i * 3.0) for i in range(5)]
+            for i, future in enumerate(futures):
+                try:
+                    memory = future.result()
+                    memory_readings.append(memory)
+                    lines.append(f"   讀取 {i+1}: {memory} bytes")
+                except Exception as e:
+                    lines.append(f"   讀取 {i+1} 失敗: {e}")
+                    memory_readings.append(0)
+        print("\n".join(lines))
+
+
         if not memory_readings or all(m == 0 for m in memory_readings):
             return {"error": "無法獲取記憶體資訊"}
             
@@ -194,26 +316,28 @@ class RealACTesterV3:
         }
         
         try:
-            status = self.get_system_status()
-            
+            status = self.get_system_status(
+                frozenset({"v3_architecture", "migration_active", "is_real_mode", "free_memory"})
+            )
+
             # 檢查 V3 架構是否啟用
-            if status.get("v3_architecture"):
+            if status.v3_architecture:
                 results["architecture_active"] = True
                 print("   ✅ V3 事件驅動架構已啟用")
             else:
                 print("   ❌ V3 架構未啟用")
                 
             # 檢查遷移狀態
-            if status.get("migration_active"):
+            if status.migration_active:
                 results["migration_working"] = True
                 print("   ✅ V2/V3 遷移管理器運行中")
             else:
                 print("   ❌ 遷移管理器未運行")
                 
             # 檢查系統整體健康度
-            connection_ok = status.get("connection", False)
-            memory_ok = status.get("free_memory", 0) > 80000
-            real_mode_ok = status.get("is_real_mode", False)
+            connection_ok = status.connection
+            memory_ok = status.free_memory > 80000
+            real_mode_ok = status.is_real_mode
             
             if connection_ok and memory_ok and real_mode_ok:
                 results["event_system_ready"] = True
@@ -221,13 +345,13 @@ class RealACTesterV3:
             else:
                 print(f"   ❌ 事件系統狀態異常 (連接:{connection_ok}, 記憶體:{memory_ok}, 真實模式:{real_mode_ok})")
                 
-            # 整體評估
-            score = sum([
-                results["architecture_active"],
-                results["migration_working"], 
-                results["event_system_ready"]
-            ])
-            
+            # 整體評估（bool 直接相加，不配置暫時 list）
+            score = (
+                results["architecture_active"]
+                + results["migration_working"]
+                + results["event_system_ready"]
+            )
+
             results["overall_health"] = score >= 2
             print(f"   整體健康度: {'✅' if results['overall_health'] else '❌'} ({score}/3)")
             
@@ -244,7 +368,7 @@ class RealACTesterV3:
         # 1. 系統狀態檢查
         print("\n📊 步驟 1: 系統狀態檢查")
         system_status = self.get_system_status()
-        if system_status.get("connection"):
+        if system_status.connection:
             print("✅ 系統連接正常")
         else:
             print("❌ 系統連接失敗")
@@ -274,16 +398,16 @@ class RealACTesterV3:
         # 計算總分
         s21_score = sum(s21_results.values()) if isinstance(s21_results, dict) else 0
         homekit_score = sum(homekit_results.values()) if isinstance(homekit_results, dict) else 0
-        memory_score = sum([
-            memory_results.get("stable", False),
-            memory_results.get("healthy", False)
-        ]) if isinstance(memory_results, dict) else 0
-        v3_score = sum([
-            v3_results.get("architecture_active", False),
-            v3_results.get("migration_working", False),
-            v3_results.get("event_system_ready", False),
-            v3_results.get("overall_health", False)
-        ]) if isinstance(v3_results, dict) else 0
+        memory_score = (
+            memory_results.get("stable", False)
+            + memory_results.get("healthy", False)
+        ) if isinstance(memory_results, dict) else 0
+        v3_score = (
+            v3_results.get("architecture_active", False)
+            + v3_results.get("migration_working", False)
+            + v3_results.get("event_system_ready", False)
+            + v3_results.get("overall_health", False)
+        ) if isinstance(v3_results, dict) else 0
         
         total_score = s21_score + homekit_score + memory_score + v3_score
         max_score = 11  # 3 + 3 + 2 + 4
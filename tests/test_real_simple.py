@@ -5,41 +5,111 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
 import re
 from typing import Dict, Any
 
+try:
+    import numpy as np  # 大量讀取時用向量化統計
+except ImportError:
+    np = None
+
+def make_session(retries: int = 3) -> requests.Session:
+    """建立帶連線池與指數退避重試的 Session（只重試 GET 的連線錯誤與 5xx）"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=1.0,
+        backoff_jitter=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
+
+# 主頁單趟掃描樣式：狀態旗標與運行時間/記憶體數值一次取得
+COMBINED_RE = re.compile(
+    r'(V3 事件驅動)|(✅ 活躍)|(切換模擬模式)|(\d+)天\s*(\d+)時\s*(\d+)分|(\d+)\s*bytes'
+)
+
+# 穩定性監控的主頁後備解析：只抓記憶體數值
+MEM_BYTES_RE = re.compile(r'(\d+)\s*bytes')
+
+# 共用連線池，所有請求打同一台設備，重複使用 TCP 連線
+_SESSION = make_session()
+# simulation-toggle 會改變設備狀態（GET 不冪等），不可自動重試
+_TOGGLE_SESSION = make_session(retries=0)
+
+# 主頁輪詢快取：url -> {"etag", "text", "status", "time"}
+_PAGE_CACHE: Dict[str, Dict[str, Any]] = {}
+
+def _conditional_get(url: str, timeout: int = 10):
+    """主頁輪詢用的條件請求，回傳 (status_code, text)。
+
+    記住上次的 ETag 並帶 If-None-Match；收到 304 時重用上次內容，
+    整頁傳輸與設備端渲染都省下來。設備若不送 validator，
+    退回 1 秒 TTL 的本地快取，避免連續輪詢重複抓同一頁。
+    """
+    now = time.time()
+    cached = _PAGE_CACHE.get(url)
+    if cached and not cached["etag"] and now - cached["time"] < 1.0:
+        return cached["status"], cached["text"]
+
+    headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else None
+    response = _SESSION.get(url, timeout=timeout, headers=headers)
+    if response.status_code == 304 and cached:
+        cached["time"] = now
+        return cached["status"], cached["text"]
+
+    _PAGE_CACHE[url] = {
+        "etag": response.headers.get("ETag"),
+        "text": response.text,
+        "status": response.status_code,
+        "time": now,
+    }
+    return response.status_code, response.text
+
 def test_real_ac_status(device_ip: str = "192.168.50.192") -> Dict[str, Any]:
     """測試真實空調狀態"""
     print("🔍 檢查真實空調系統狀態...")
     
     try:
-        # 1. 主頁狀態檢查
-        response = requests.get(f"http://{device_ip}:8080/", timeout=10)
-        main_page = response.text
-        
+        # 1. V3 架構與記憶體狀態走 /api/status JSON，不依賴 UI 字串
+        status_response = _SESSION.get(f"http://{device_ip}:8080/api/status", timeout=10)
+        status_data = status_response.json() if status_response.status_code == 200 else {}
+
         results = {
-            "connection_ok": response.status_code == 200,
-            "v3_active": "V3 事件驅動" in main_page,
-            "migration_active": "✅ 活躍" in main_page,
-            "real_mode": "切換模擬模式" in main_page,
+            "connection_ok": status_response.status_code == 200,
+            "v3_active": bool(status_data.get("v3Architecture")),
+            "migration_active": False,
+            "real_mode": False,
             "runtime_minutes": 0,
-            "free_memory": 0
+            "free_memory": int(status_data.get("freeHeap", 0))
         }
-        
-        # 解析運行時間
-        runtime_match = re.search(r'(\d+)天\s*(\d+)時\s*(\d+)分', main_page)
-        if runtime_match:
-            days, hours, minutes = map(int, runtime_match.groups())
-            results["runtime_minutes"] = days * 1440 + hours * 60 + minutes
-        
-        # 解析記憶體
-        memory_match = re.search(r'(\d+)\s*bytes', main_page)
-        if memory_match:
-            results["free_memory"] = int(memory_match.group(1))
-        
-        # 2. 模式確認檢查
-        mode_response = requests.get(f"http://{device_ip}:8080/simulation-toggle", timeout=5)
+
+        # 2. JSON 尚未涵蓋的欄位仍從主頁解析（條件請求＋單趟掃描）
+        main_status, main_page = _conditional_get(f"http://{device_ip}:8080/", timeout=10)
+        if not results["connection_ok"]:
+            # 韌體沒有 /api/status 時，連通性以主頁回應判定
+            results["connection_ok"] = main_status == 200
+        for match in COMBINED_RE.finditer(main_page):
+            if match.group(1):
+                results["v3_active"] = True  # 舊韌體沒有 v3Architecture 欄位時的後備
+            elif match.group(2):
+                results["migration_active"] = True
+            elif match.group(3):
+                results["real_mode"] = True
+            elif match.group(4) and not results["runtime_minutes"]:
+                days, hours, minutes = map(int, match.group(4, 5, 6))
+                results["runtime_minutes"] = days * 1440 + hours * 60 + minutes
+            elif match.group(7) and not results["free_memory"]:
+                results["free_memory"] = int(match.group(7))
+
+        # 3. 模式確認檢查
+        mode_response = _TOGGLE_SESSION.get(f"http://{device_ip}:8080/simulation-toggle", timeout=5)
         mode_page = mode_response.text
         results["mode_confirmed"] = "🏭 真實模式" in mode_page
         
@@ -54,12 +124,12 @@ def test_homekit_readiness(device_ip: str = "192.168.50.192") -> Dict[str, Any]:
     
     try:
         # HomeKit 設定頁面
-        homekit_response = requests.get(f"http://{device_ip}:8080/homekit", timeout=5)
+        homekit_response = _SESSION.get(f"http://{device_ip}:8080/homekit", timeout=5)
         homekit_ok = homekit_response.status_code == 200 and "HomeKit" in homekit_response.text
         
         # 系統響應測試
         start_time = time.time()
-        status_response = requests.get(f"http://{device_ip}:8080/", timeout=5)
+        status_response = _SESSION.get(f"http://{device_ip}:8080/", timeout=5)
         response_time = time.time() - start_time
         
         return {
@@ -81,16 +151,23 @@ def monitor_system_stability(device_ip: str = "192.168.50.192", readings: int =
     
     for i in range(readings):
         try:
+            # 改用 /api/health JSON 端點（v1/v2 韌體都提供，帶 freeHeap），
+            # 省去整頁 HTML 傳輸與解析
             start_time = time.time()
-            response = requests.get(f"http://{device_ip}:8080/", timeout=5)
+            response = _SESSION.get(f"http://{device_ip}:8080/api/health", timeout=5)
             response_time = time.time() - start_time
-            
+
             response_times.append(response_time)
-            
-            # 解析記憶體
-            memory_match = re.search(r'(\d+)\s*bytes', response.text)
-            if memory_match:
-                memory = int(memory_match.group(1))
+
+            memory = response.json().get("freeHeap", 0) if response.status_code == 200 else 0
+            if memory <= 0:
+                # 沒有 JSON 端點的韌體退回主頁掃描（條件請求，1 秒內重用快取）
+                page_status, page = _conditional_get(f"http://{device_ip}:8080/", timeout=5)
+                if page_status == 200:
+                    mem_match = MEM_BYTES_RE.search(page)
+                    if mem_match:
+                        memory = int(mem_match.group(1))
+            if memory > 0:
                 memory_readings.append(memory)
                 print(f"   讀取 {i+1}: 記憶體 {memory} bytes, 響應時間 {response_time:.2f}s")
             else:
@@ -111,17 +188,33 @@ def monitor_system_stability(device_ip: str = "192.168.50.192", readings: int =
     
     if not valid_memory:
         return {"error": "無法獲取有效的記憶體資料"}
-    
+
+    # 統計彙總：有 NumPy 時用向量化 C 實作，readings 拉大也不需改寫
+    if np is not None:
+        mem = np.asarray(valid_memory, dtype=np.int32)
+        memory_min, memory_max = int(mem.min()), int(mem.max())
+        memory_avg = float(mem.mean())
+        if valid_response:
+            response_avg = float(np.asarray(valid_response, dtype=np.float64).mean())
+        else:
+            response_avg = 10.0
+    else:
+        memory_min, memory_max = min(valid_memory), max(valid_memory)
+        memory_avg = sum(valid_memory) / len(valid_memory)
+        response_avg = sum(valid_response) / len(valid_response) if valid_response else 10.0
+
+    memory_variance = memory_max - memory_min
+
     return {
         "memory_readings": memory_readings,
         "response_times": response_times,
-        "memory_min": min(valid_memory),
-        "memory_max": max(valid_memory),
-        "memory_avg": sum(valid_memory) / len(valid_memory),
-        "memory_variance": max(valid_memory) - min(valid_memory),
-        "response_avg": sum(valid_response) / len(valid_response) if valid_response else 10.0,
-        "stable": (max(valid_memory) - min(valid_memory)) < 15000,  # 允許 15KB 變化
-        "responsive": (sum(valid_response) / len(valid_response) if valid_response else 10.0) < 1.0
+        "memory_min": memory_min,
+        "memory_max": memory_max,
+        "memory_avg": memory_avg,
+        "memory_variance": memory_variance,
+        "response_avg": response_avg,
+        "stable": memory_variance < 15000,  # 允許 15KB 變化
+        "responsive": response_avg < 1.0
     }
 
 def main():
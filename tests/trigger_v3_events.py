@@ -4,37 +4,58 @@
 通過操作真實空調來觸發 V3 架構中的事件
 """
 
+import re
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def trigger_v3_events(device_ip="192.168.50.192"):
+# 共用連線：三個檢查都打同一台設備的 8080 端口，重複使用 keep-alive 連線
+SESSION = requests.Session()
+
+# 事件統計行的定位標記，長度在模組層算好
+_STATS_MARK = "事件統計:"
+_STATS_MARK_LEN = len(_STATS_MARK)
+
+# V3/遷移標記合併成單一交替式，一趟掃描取代兩次獨立子串搜尋
+_V3_MARKS_RE = re.compile(r'(V3 事件驅動)|(✅ 活躍)')
+
+# 調試端點主體的關鍵字：IGNORECASE 交替式免去整頁 .lower() 複本
+_DEBUG_TOKENS_RE = re.compile(r'event|stats', re.IGNORECASE)
+
+def trigger_v3_events(device_ip="192.168.50.192", content=None):
     """
     觸發 V3 事件的幾種方法：
     1. 通過 HomeKit 操作（如果在真實模式下）
     2. 檢查是否有可用的調試端點
     3. 檢查事件統計變化
+
+    呼叫端已抓過主頁時可傳入 content，省掉一趟重複的 HTTP 請求。
     """
-    
+
     print("🔍 檢查當前 V3 事件統計...")
-    
-    # 獲取初始統計
-    response = requests.get(f"http://{device_ip}:8080/", timeout=5)
-    content = response.text
+
+    # 獲取初始統計（main() 的連通性檢查已抓過的頁面直接重用）
+    if content is None:
+        content = SESSION.get(f"http://{device_ip}:8080/", timeout=(1.0, 5.0)).text
     
     print("📊 當前頁面事件統計:")
-    if "事件統計:" in content:
-        stats_line = content.split("事件統計:")[1].split("</p>")[0]
+    # find + 切片只配置一個子字串，不像 split 會複製整頁兩次
+    i = content.find(_STATS_MARK)
+    if i != -1:
+        j = content.find("</p>", i)
+        stats_line = content[i + _STATS_MARK_LEN:j if j != -1 else len(content)]
         print(f"   {stats_line}")
     
     print("\n🔍 分析問題原因...")
     
-    # 檢查 V3 架構是否真的啟用
-    if "V3 事件驅動" in content:
+    # 檢查 V3 架構是否真的啟用（兩個標記一趟掃描）
+    found = {m.lastindex for m in _V3_MARKS_RE.finditer(content)}
+    if 1 in found:
         print("✅ V3 架構已啟用")
     else:
         print("❌ V3 架構未啟用")
-        
-    if "✅ 活躍" in content:
+
+    if 2 in found:
         print("✅ 遷移管理器活躍")
     else:
         print("❌ 遷移管理器不活躍")
@@ -76,20 +97,33 @@ def check_event_system_internals(device_ip="192.168.50.192"):
         "/api/status"
     ]
     
-    for endpoint in debug_endpoints:
+    # 四個端點彼此獨立，並行探測：最壞情況等一個 timeout 而不是四個。
+    # stream GET 一趟搞定：狀態碼先到、主體只在 200 時才讀——
+    # 404/500 關閉連線不讀主體，也不會像 HEAD 被不支援的伺服器回 405
+    def probe(endpoint):
+        lines = []
+        url = f"http://{device_ip}:8080{endpoint}"
         try:
-            response = requests.get(f"http://{device_ip}:8080{endpoint}", timeout=3)
-            if response.status_code == 200:
-                print(f"✅ {endpoint} 可訪問 (HTTP {response.status_code})")
-                if "event" in response.text.lower() or "stats" in response.text.lower():
-                    print(f"   包含事件/統計相關資訊")
-            elif response.status_code == 404:
-                print(f"❌ {endpoint} 不存在 (HTTP 404)")
-            else:
-                print(f"⚠️ {endpoint} 異常 (HTTP {response.status_code})")
+            response = SESSION.get(url, timeout=(1.0, 3.0), stream=True, allow_redirects=False)
+            try:
+                if response.status_code == 200:
+                    lines.append(f"✅ {endpoint} 可訪問 (HTTP {response.status_code})")
+                    if _DEBUG_TOKENS_RE.search(response.text):
+                        lines.append(f"   包含事件/統計相關資訊")
+                elif response.status_code == 404:
+                    lines.append(f"❌ {endpoint} 不存在 (HTTP 404)")
+                else:
+                    lines.append(f"⚠️ {endpoint} 異常 (HTTP {response.status_code})")
+            finally:
+                response.close()
         except Exception as e:
-            print(f"❌ {endpoint} 連接失敗: {e}")
-    
+            lines.append(f"❌ {endpoint} 連接失敗: {e}")
+        return lines
+
+    with ThreadPoolExecutor(max_workers=len(debug_endpoints)) as executor:
+        for lines in executor.map(probe, debug_endpoints):
+            print("\n".join(lines))
+
     return True
 
 def main():
@@ -100,16 +134,16 @@ def main():
     
     # 基本檢查
     try:
-        response = requests.get(f"http://{device_ip}:8080/", timeout=5)
+        response = SESSION.get(f"http://{device_ip}:8080/", timeout=(1.0, 5.0))
         if response.status_code != 200:
             print("❌ 設備不可達")
             return 1
     except Exception as e:
         print(f"❌ 設備連接失敗: {e}")
         return 1
-    
-    # 觸發和分析事件
-    trigger_v3_events(device_ip)
+
+    # 觸發和分析事件（重用連通性檢查抓回的頁面）
+    trigger_v3_events(device_ip, response.text)
     
     # 檢查系統內部
     check_event_system_internals(device_ip)